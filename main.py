@@ -40,7 +40,8 @@ from multimodal_rag import (
     get_llm,
     process_document_for_text,
     process_document_for_images,
-    format_image_info
+    format_image_info,
+    render_image_results
 )
 
 from pdf_processor import(
@@ -227,6 +228,7 @@ def generate_personalized_response(query):
         
         return {
             "answer_text": response.content,
+            "text_results": text_results,
             "image_results": image_results,
             "has_images": len(image_results) > 0,
             "original_query": query,
@@ -241,6 +243,7 @@ def generate_personalized_response(query):
         
         return {
             "answer_text": f"I encountered an error while processing your query. Please try again or rephrase your question.",
+            "text_results": [],
             "image_results": [],
             "has_images": False,
             "original_query": query,
@@ -311,39 +314,20 @@ with tab1:
                     # Show images if available and enabled
                     image_results = message["content"].get("image_results", [])
                     if image_results and st.session_state.include_images:
-                        st.subheader("Relevant Images:")
-                        
-                        # Determine number of columns (max 3)
-                        num_cols = min(3, len(image_results))
-                        cols = st.columns(num_cols)
-                        
-                        for i, (col, img) in enumerate(zip(cols, image_results)):
-                            with col:
-                                try:
-                                    # Display image from base64
-                                    st.image(
-                                        f"data:image/png;base64,{img['image_data']}", 
-                                        caption=f"Image {i+1}", 
-                                        use_column_width=True
-                                    )
-                                    st.markdown(f"**Score**: {img['similarity_score']:.2f}")
-                                    st.markdown(format_image_info(img))
-                                except Exception as img_err:
-                                    st.error(f"Error displaying image {i+1}: {str(img_err)}")
+                        render_image_results(image_results)
                 
-                    # Display text sources if enabled
+                    # Display text sources if enabled, reusing the results
+                    # stored with the message instead of re-searching
                     if st.session_state.show_sources and isinstance(message["content"], dict):
-                        query = message["content"].get("original_query", "")
-                        if query:
-                            text_results = search_text_chunks(query)
-                            text_context = "\n\n".join([
-                                f"Source: {result['module_code']}, Lecture {result.get('lecture_number', 'Unknown')}, Page {result['page']}\n"
-                                f"Content: {result['content']}"
-                                for result in text_results
-                            ]) if text_results else "No relevant text information found."
-                            
-                            with st.expander("View Text Sources", expanded=False):
-                                st.markdown(text_context)
+                        text_results = message["content"].get("text_results", [])
+                        text_context = "\n\n".join([
+                            f"Source: {result['module_code']}, Lecture {result.get('lecture_number', 'Unknown')}, Page {result['page']}\n"
+                            f"Content: {result['content']}"
+                            for result in text_results
+                        ]) if text_results else "No relevant text information found."
+
+                        with st.expander("View Text Sources", expanded=False):
+                            st.markdown(text_context)
                 else:
                     # Just show text
                     st.markdown(message["content"])
@@ -376,38 +360,18 @@ with tab1:
                 # Display images if available and enabled
                 image_results = response.get("image_results", [])
                 if image_results and st.session_state.include_images:
-                    st.subheader("Relevant Images:")
-                    
-                    if not image_results:
-                        st.warning("No images were found for this query.")
-                    else:
-                        # Determine number of columns (max 3)
-                        num_cols = min(3, len(image_results))
-                        cols = st.columns(num_cols)
-                        
-                        for i, (col, img) in enumerate(zip(cols, image_results)):
-                            with col:
-                                try:
-                                    # Display image from base64
-                                    st.image(
-                                        f"data:image/png;base64,{img['image_data']}", 
-                                        caption=f"Image {i+1}", 
-                                        use_column_width=True
-                                    )
-                                    st.markdown(f"**Score**: {img['similarity_score']:.2f}")
-                                    st.markdown(format_image_info(img))
-                                except Exception as img_err:
-                                    st.error(f"Error displaying image {i+1}: {str(img_err)}")
+                    render_image_results(image_results)
                 
-                # Display text sources if enabled
+                # Display text sources if enabled, from the retrieval
+                # already performed inside generate_personalized_response
                 if st.session_state.show_sources:
-                    text_results = search_text_chunks(prompt)
+                    text_results = response.get("text_results", [])
                     text_context = "\n\n".join([
                         f"Source: {result['module_code']}, Lecture {result.get('lecture_number', 'Unknown')}, Page {result['page']}\n"
                         f"Content: {result['content']}"
                         for result in text_results
                     ]) if text_results else "No relevant text information found."
-                    
+
                     with st.expander("View Text Sources", expanded=False):
                         st.markdown(text_context)
 
@@ -511,60 +475,85 @@ with tab2:
                 help="Title of the lecture"
             )
         
-        # Advanced configuration (collapsible)
+        # Advanced configuration (collapsible). The widgets live inside a
+        # form so mid-drag slider events don't rerun the whole script -
+        # values only take effect when Apply is clicked
         with st.expander("Advanced Configuration", expanded=False):
-            st.subheader("Embedding Configuration")
-            
-            # Create columns for advanced settings
-            adv_col1, adv_col2 = st.columns(2)
-            
-            with adv_col1:
-                image_weight = st.slider(
-                    "Image Weight", 
-                    min_value=0.0, 
-                    max_value=1.0, 
-                    value=0.3, 
-                    step=0.1,
-                    help="Weight given to image embeddings (text weight = 1 - image weight)"
-                )
-                
-                similarity_threshold = st.slider(
-                    "Similarity Threshold", 
-                    min_value=0.80, 
-                    max_value=0.99, 
-                    value=0.98, 
-                    step=0.01,
-                    help="Threshold for determining similar images during filtering"
-                )
-                
-                batch_size = st.slider(
-                    "Batch Size", 
-                    min_value=1, 
-                    max_value=16, 
-                    value=8,
-                    help="Number of images to process at once (higher values use more memory)"
-                )
-            
-            with adv_col2:
-                use_dim_reduction = st.checkbox(
-                    "Use Dimensionality Reduction", 
-                    value=True,
-                    help="Reduce embedding dimensions for efficiency"
-                )
-                
-                output_dim = st.select_slider(
-                    "Output Dimension", 
-                    options=[128, 256, 384, 512, 768],
-                    value=512,
-                    help="Dimension of the final embeddings"
-                )
-                
-                use_alignment = st.checkbox(
-                    "Use Embedding Alignment", 
-                    value=True,
-                    help="Align image and text embeddings for better multimodal representation"
-                )
-        
+            with st.form("advanced_cfg"):
+                st.subheader("Embedding Configuration")
+
+                # Create columns for advanced settings
+                adv_col1, adv_col2 = st.columns(2)
+
+                with adv_col1:
+                    image_weight = st.slider(
+                        "Image Weight",
+                        min_value=0.0,
+                        max_value=1.0,
+                        value=0.3,
+                        step=0.1,
+                        help="Weight given to image embeddings (text weight = 1 - image weight)"
+                    )
+
+                    similarity_threshold = st.slider(
+                        "Similarity Threshold",
+                        min_value=0.80,
+                        max_value=0.99,
+                        value=0.98,
+                        step=0.01,
+                        help="Threshold for determining similar images during filtering"
+                    )
+
+                    batch_size = st.slider(
+                        "Batch Size",
+                        min_value=1,
+                        max_value=16,
+                        value=8,
+                        help="Number of images to process at once (higher values use more memory)"
+                    )
+
+                with adv_col2:
+                    use_dim_reduction = st.checkbox(
+                        "Use Dimensionality Reduction",
+                        value=True,
+                        help="Reduce embedding dimensions for efficiency"
+                    )
+
+                    output_dim = st.select_slider(
+                        "Output Dimension",
+                        options=[128, 256, 384, 512, 768],
+                        value=512,
+                        help="Dimension of the final embeddings"
+                    )
+
+                    use_alignment = st.checkbox(
+                        "Use Embedding Alignment",
+                        value=True,
+                        help="Align image and text embeddings for better multimodal representation"
+                    )
+
+                if st.form_submit_button("Apply Configuration"):
+                    st.session_state.advanced_cfg = {
+                        "image_weight": image_weight,
+                        "similarity_threshold": similarity_threshold,
+                        "batch_size": batch_size,
+                        "use_dim_reduction": use_dim_reduction,
+                        "output_dim": output_dim,
+                        "use_alignment": use_alignment,
+                    }
+
+        # The processing path reads the last applied values; the defaults
+        # mirror the form's initial widget values for users who never open
+        # the expander
+        advanced_cfg = st.session_state.get("advanced_cfg", {
+            "image_weight": 0.3,
+            "similarity_threshold": 0.98,
+            "batch_size": 8,
+            "use_dim_reduction": True,
+            "output_dim": 512,
+            "use_alignment": True,
+        })
+
         # File uploader for PDF
         uploaded_file_img = st.file_uploader("Upload a PDF document for image extraction", type=["pdf"], key="img_upload")
         
@@ -576,22 +565,22 @@ with tab2:
                     # Create config with user-specified parameters
                     config = EmbeddingConfig(
                         # Embedding weights
-                        image_weight=image_weight,
-                        text_weight=1.0 - image_weight,
-                        
+                        image_weight=advanced_cfg["image_weight"],
+                        text_weight=1.0 - advanced_cfg["image_weight"],
+
                         # Similarity threshold for filtering
-                        similarity_threshold=similarity_threshold,
-                        
+                        similarity_threshold=advanced_cfg["similarity_threshold"],
+
                         # Processing parameters
-                        batch_size=batch_size,
-                        
+                        batch_size=advanced_cfg["batch_size"],
+
                         # Dimension reduction settings
-                        use_dim_reduction=use_dim_reduction,
-                        output_dim=output_dim,
-                        
+                        use_dim_reduction=advanced_cfg["use_dim_reduction"],
+                        output_dim=advanced_cfg["output_dim"],
+
                         # Alignment settings
-                        use_embedding_alignment=use_alignment,
-                        
+                        use_embedding_alignment=advanced_cfg["use_alignment"],
+
                         # Database settings
                         mongodb_collection=mongo_collection,
                         milvus_collection=milvus_collection
@@ -2,16 +2,21 @@ import streamlit as st
 import os
 import tempfile
 import torch
+import numpy as np
 import pandas as pd
+import pymongo
+from pymilvus import connections as milvus_connections
 from PIL import Image
-import io
-import base64
 import matplotlib.pyplot as plt
 from datetime import datetime
 import uuid
 import json
 import sys
+import asyncio
+import itertools
 import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
 from typing import Dict, List, Any, Optional
 
 # LangChain imports
@@ -49,6 +54,19 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
+# Open the shared Milvus gRPC channel once at import - Streamlit reruns
+# reuse the already-imported module, so every Collection() lookup shares
+# this channel instead of paying a fresh handshake
+try:
+    milvus_connections.connect("default", host="localhost", port="19530")
+except Exception as milvus_conn_err:
+    logger.warning(f"Could not connect to Milvus at import time: {milvus_conn_err}")
+
+@st.cache_resource
+def get_mongo():
+    """Shared MongoDB client with connection pooling, created once per process"""
+    return pymongo.MongoClient("mongodb://localhost:27017/", maxPoolSize=32)
+
 # -------- CORE FUNCTIONALITY (KEEP THIS SECTION AT MODULE LEVEL) --------
 
 # Enhanced function with lecture number
@@ -66,35 +84,315 @@ def format_image_info(img):
     # Combine all information into a well-formatted string
     return f"{source_info}, {lecture_info}, {page_info}"
 
+def render_image_results(image_results):
+    """Render matched images in up to three columns with score and source info
+
+    Shared by the live-response path and history replay so the layout only
+    exists in one place.
+    """
+    if not image_results:
+        return
+
+    st.subheader("Relevant Images:")
+
+    # Determine number of columns (max 3)
+    num_cols = min(3, len(image_results))
+    cols = st.columns(num_cols)
+
+    for i, (col, img) in enumerate(zip(cols, image_results)):
+        with col:
+            try:
+                st.image(
+                    img["image"],
+                    caption=f"Image {i+1}",
+                    use_column_width=True
+                )
+                st.markdown(f"**Score**: {img['similarity_score']:.2f}")
+                st.markdown(format_image_info(img))
+            except Exception as img_err:
+                st.error(f"Error displaying image {i+1}: {str(img_err)}")
+
+# Directory where the int8-quantized ONNX export of MiniLM is persisted so
+# the (one-time) export/quantization cost is not paid on every process start
+_ONNX_MODEL_DIR = "saved_models/minilm_onnx_int8"
+
+class ONNXMiniLMEmbeddings:
+    """MiniLM embeddings served from an int8-quantized ONNX Runtime session
+
+    Exposes the same embed_documents/embed_query interface as the LangChain
+    embeddings classes, so the Milvus vectorstore can use it unchanged.
+    """
+    def __init__(self, model_dir=_ONNX_MODEL_DIR):
+        from optimum.onnxruntime import ORTModelForFeatureExtraction
+        from transformers import AutoTokenizer
+
+        self.tokenizer = AutoTokenizer.from_pretrained(model_dir, use_fast=True)
+        self.model = ORTModelForFeatureExtraction.from_pretrained(
+            model_dir,
+            file_name="model_quantized.onnx",
+            provider="CPUExecutionProvider"
+        )
+
+    def _encode(self, texts):
+        """Tokenize, run the ORT session, mean-pool and L2-normalize"""
+        inputs = self.tokenizer(
+            texts, padding=True, truncation=True, max_length=256, return_tensors="pt"
+        )
+        outputs = self.model(**inputs)
+        mask = inputs["attention_mask"].unsqueeze(-1).float()
+        pooled = (outputs.last_hidden_state * mask).sum(dim=1) / mask.sum(dim=1).clamp(min=1e-9)
+        normalized = torch.nn.functional.normalize(pooled, p=2, dim=1)
+        return normalized.cpu().numpy()
+
+    def embed_documents(self, texts):
+        return [vec.tolist() for vec in self._encode(list(texts))]
+
+    def embed_query(self, text):
+        return self._encode([text])[0].tolist()
+
+class TEIEmbeddings:
+    """Client for a Text-Embeddings-Inference server
+
+    TEI batches requests across concurrent sessions server-side, so N
+    parallel users share one forward pass instead of each running the model
+    in-process. Exposes the LangChain embed_documents/embed_query interface.
+    """
+    def __init__(self, base_url):
+        import requests
+
+        self._session = requests.Session()
+        self._embed_url = base_url.rstrip("/") + "/embed"
+
+    def embed_documents(self, texts):
+        response = self._session.post(self._embed_url, json={"inputs": list(texts)})
+        response.raise_for_status()
+        return response.json()
+
+    def embed_query(self, text):
+        return self.embed_documents([text])[0]
+
+def _export_quantized_minilm(model_dir):
+    """Export MiniLM to ONNX and apply dynamic int8 quantization (one-time)"""
+    from optimum.onnxruntime import ORTModelForFeatureExtraction, ORTQuantizer
+    from optimum.onnxruntime.configuration import AutoQuantizationConfig
+    from transformers import AutoTokenizer
+
+    logger.info("Exporting and quantizing MiniLM to ONNX int8 (one-time setup)...")
+    model = ORTModelForFeatureExtraction.from_pretrained(
+        "sentence-transformers/all-MiniLM-L6-v2", export=True
+    )
+    quantizer = ORTQuantizer.from_pretrained(model)
+    quantizer.quantize(
+        save_dir=model_dir,
+        quantization_config=AutoQuantizationConfig.avx512_vnni(is_static=False)
+    )
+    tokenizer = AutoTokenizer.from_pretrained("sentence-transformers/all-MiniLM-L6-v2")
+    tokenizer.save_pretrained(model_dir)
+    logger.info(f"Quantized MiniLM saved to {model_dir}")
+
+# Cached model/vectorstore accessors - loaded once per process and reused
+# across every query instead of being rebuilt per call
+@st.cache_resource
+def get_embeddings():
+    """Load the embedding model once and reuse it across queries
+
+    Prefers a Text-Embeddings-Inference server when TEI_EMBEDDINGS_URL is
+    set (dynamic cross-session batching), then the int8 ONNX Runtime build
+    (roughly 2x embedding throughput on CPU via VNNI int8 MatMul), and
+    finally the in-process PyTorch model.
+    """
+    tei_url = os.getenv("TEI_EMBEDDINGS_URL")
+    if tei_url:
+        logger.info(f"Using TEI embedding server at {tei_url}")
+        return TEIEmbeddings(tei_url)
+
+    try:
+        if not os.path.isdir(_ONNX_MODEL_DIR):
+            _export_quantized_minilm(_ONNX_MODEL_DIR)
+        return ONNXMiniLMEmbeddings(_ONNX_MODEL_DIR)
+    except ImportError:
+        logger.info("optimum/onnxruntime not installed, using PyTorch embeddings")
+    except Exception as e:
+        logger.warning(f"Could not load quantized ONNX embeddings, falling back: {e}")
+
+    return HuggingFaceEmbeddings(
+        model_name="all-MiniLM-L6-v2",
+        model_kwargs={"device": "cuda" if torch.cuda.is_available() else "cpu"}
+    )
+
+@st.cache_resource
+def get_text_splitter():
+    """Token-aware splitter sized to MiniLM's context window
+
+    Character counting (length_function=len) produced chunks that never
+    lined up with the model's 256-token limit - either truncated or padded.
+    Counting with the model's own fast tokenizer keeps every chunk inside
+    the window; 220 tokens plus 40 overlap leaves headroom for specials.
+    """
+    try:
+        from transformers import AutoTokenizer
+
+        tokenizer = AutoTokenizer.from_pretrained(
+            "sentence-transformers/all-MiniLM-L6-v2", use_fast=True
+        )
+        return RecursiveCharacterTextSplitter.from_huggingface_tokenizer(
+            tokenizer, chunk_size=220, chunk_overlap=40
+        )
+    except Exception as e:
+        logger.warning(f"Falling back to character-based splitting: {e}")
+        return RecursiveCharacterTextSplitter(
+            chunk_size=1000, chunk_overlap=200, length_function=len
+        )
+
+@st.cache_resource
+def get_text_vectorstore():
+    """Connect to the Milvus text collection once and keep the handle alive"""
+    return Milvus(
+        embedding_function=get_embeddings(),
+        collection_name="combined_text_collection",
+        connection_args={"host": "localhost", "port": "19530"}
+    )
+
+# Index/search tuning for the text collection: HNSW graph traversal is
+# O(log n) and well suited to the interactive top-k=5 path; ef=64 keeps
+# recall high for small k while bounding the search beam width
+_TEXT_INDEX_PARAMS = {
+    "index_type": "HNSW",
+    "metric_type": "L2",
+    "params": {"M": 16, "efConstruction": 200}
+}
+_TEXT_SEARCH_PARAMS = {"metric_type": "L2", "params": {"ef": 64}}
+
+# GPU offload: when the Milvus deployment is built with GPU support (and
+# gpu.initMemSize/maxMemSize configured server-side), setting
+# MILVUS_GPU_INDEX=1 switches new indexes to GPU_CAGRA, which batches
+# concurrent queries from multiple sessions on one GPU
+_USE_GPU_INDEX = os.getenv("MILVUS_GPU_INDEX", "").lower() in ("1", "true", "yes")
+if _USE_GPU_INDEX:
+    _TEXT_INDEX_PARAMS = {
+        "index_type": "GPU_CAGRA",
+        "metric_type": "L2",
+        "params": {"intermediate_graph_degree": 64, "graph_degree": 32}
+    }
+    _TEXT_SEARCH_PARAMS = {
+        "metric_type": "L2",
+        "params": {"itopk_size": 64, "search_width": 4}
+    }
+
+def _ensure_text_index(vectorstore):
+    """Create the HNSW index on the text collection if it is missing"""
+    try:
+        col = getattr(vectorstore, "col", None)
+        if col is not None:
+            if not col.has_index():
+                col.create_index("vector", _TEXT_INDEX_PARAMS)
+            col.load()
+    except Exception as e:
+        logger.warning(f"Could not ensure HNSW index on text collection: {e}")
+
+# Semantic response cache: near-duplicate queries ("what is X?" vs
+# "explain X") embed close together, so responses are keyed by query
+# embedding and looked up with a cosine threshold instead of exact match
+_SEMANTIC_CACHE_SIZE = 512
+_SEMANTIC_CACHE_THRESHOLD = 0.95
+_semantic_cache_embeddings = []  # L2-normalized query embeddings
+_semantic_cache_responses = []   # response dicts, parallel to embeddings
+# Streamlit serves each session on its own thread, so lookup/store must not
+# interleave their list mutations
+_semantic_cache_lock = threading.Lock()
+
+def _normalize_embedding(embedding):
+    """Return the embedding as an L2-normalized float32 ndarray"""
+    vec = np.asarray(embedding, dtype=np.float32)
+    norm = np.linalg.norm(vec)
+    return vec / norm if norm > 0 else vec
+
+def _semantic_cache_lookup(query_embedding):
+    """Return the cached response for a semantically similar query, or None"""
+    q_vec = _normalize_embedding(query_embedding)
+    with _semantic_cache_lock:
+        if not _semantic_cache_embeddings:
+            return None
+        sims = np.stack(_semantic_cache_embeddings) @ q_vec
+        best = int(np.argmax(sims))
+        if sims[best] > _SEMANTIC_CACHE_THRESHOLD:
+            # Move the hit to the end so LRU eviction keeps hot entries
+            _semantic_cache_embeddings.append(_semantic_cache_embeddings.pop(best))
+            _semantic_cache_responses.append(_semantic_cache_responses.pop(best))
+            return _semantic_cache_responses[-1]
+    return None
+
+def _semantic_cache_store(query_embedding, response):
+    """Store a response keyed by its query embedding, evicting oldest first"""
+    q_vec = _normalize_embedding(query_embedding)
+    with _semantic_cache_lock:
+        if len(_semantic_cache_embeddings) >= _SEMANTIC_CACHE_SIZE:
+            _semantic_cache_embeddings.pop(0)
+            _semantic_cache_responses.pop(0)
+        _semantic_cache_embeddings.append(q_vec)
+        _semantic_cache_responses.append(response)
+
 # Initialize LLM
-def get_llm():
+@st.cache_resource
+def get_llm(streaming=False):
     # Get API key from environment or from session if already set
     GEMINI_API_KEY = os.getenv("GEMINI_API_KEY")
-    
-    return ChatGoogleGenerativeAI(
+
+    llm = ChatGoogleGenerativeAI(
         model="gemini-1.5-flash",
         google_api_key=GEMINI_API_KEY,
         temperature=0.2,
-        convert_system_message_to_human=True
+        convert_system_message_to_human=True,
+        streaming=streaming
     )
 
+    # One-time health check when the cached instance is first built; this
+    # used to be a full Gemini round-trip on every user turn
+    try:
+        llm.invoke("Hello, are you working properly?")
+        logger.info("LLM health check successful")
+    except Exception as health_check_error:
+        logger.warning(f"LLM health check failed: {health_check_error}")
+
+    return llm
+
 # Core functions for search and retrieval
-def search_text_chunks(query, top_k=5):
-    """Search for relevant text chunks using the query"""
+def _metadata_filter_expr(module_field, module_value, lecture_number):
+    """Build a Milvus boolean expression from the optional metadata filters"""
+    expr_parts = []
+    if module_value:
+        expr_parts.append(f'{module_field} == "{module_value}"')
+    if lecture_number is not None:
+        expr_parts.append(f'lecture_number == {int(lecture_number)}')
+    return " && ".join(expr_parts) if expr_parts else None
+
+def search_text_chunks(query, top_k=5, query_embedding=None,
+                       module_code=None, lecture_number=None):
+    """Search for relevant text chunks using the query
+
+    If the caller already embedded the query (e.g. for the semantic cache),
+    pass query_embedding to skip the redundant model forward pass. Passing
+    module_code and/or lecture_number pre-filters the collection so the ANN
+    search only scans matching candidates.
+    """
     try:
-        # Initialize HuggingFace embeddings
-        embeddings = HuggingFaceEmbeddings(model_name="all-MiniLM-L6-v2")
-        
-        # Connect to Milvus
-        vectorstore = Milvus(
-            embedding_function=embeddings,
-            collection_name="combined_text_collection",
-            connection_args={"host": "localhost", "port": "19530"}
-        )
-        
-        # Search for relevant documents
-        docs = vectorstore.similarity_search(query, k=top_k)
-        
+        # Reuse the cached vectorstore (and its embedding model) instead of
+        # reloading them on every call
+        vectorstore = get_text_vectorstore()
+
+        expr = _metadata_filter_expr("module_code", module_code, lecture_number)
+
+        # Search for relevant documents, reusing the precomputed embedding
+        # when available
+        if query_embedding is not None:
+            docs = vectorstore.similarity_search_by_vector(
+                query_embedding, k=top_k, param=_TEXT_SEARCH_PARAMS, expr=expr
+            )
+        else:
+            docs = vectorstore.similarity_search(
+                query, k=top_k, param=_TEXT_SEARCH_PARAMS, expr=expr
+            )
+
         # Format for easier consumption
         results = [
             {
@@ -114,18 +412,24 @@ def search_text_chunks(query, top_k=5):
         logger.error(f"Error searching text: {e}")
         return []
 
-def search_images(query, top_k=3):
-    """Search for relevant images using the query"""
+def search_images(query, top_k=3, module_code=None, lecture_number=None):
+    """Search for relevant images using the query
+
+    module_code / lecture_number narrow the search to matching documents
+    before the vector scan (the image schema stores the module as module_id).
+    """
     try:
         # Log the start of the image search
         logger.info(f"Starting image search for query: '{query}' with top_k={top_k}")
-        
+
         # Use existing image search function
         matches = search_images_by_text(
             query=query,
             top_k=top_k,
             milvus_collection="combined_embeddings_7",
-            mongodb_collection="pdf_images_7"
+            mongodb_collection="pdf_images_7",
+            mongo_client=get_mongo(),
+            expr=_metadata_filter_expr("module_id", module_code, lecture_number)
         )
         
         # Log the number of matches found
@@ -135,18 +439,21 @@ def search_images(query, top_k=3):
         results = []
         for i, match in enumerate(matches):
             try:
-                # Convert PIL image to base64 for display in Streamlit
+                # Pass the PIL image straight through - st.image accepts it
+                # directly, so there is no need for a PNG/base64 round-trip
                 if not match.get("image"):
                     logger.warning(f"Match {i} has no image data")
                     continue
-                    
-                buffer = io.BytesIO()
-                match["image"].save(buffer, format="PNG")
-                img_str = base64.b64encode(buffer.getvalue()).decode("utf-8")
-                
+
+                # Downscale to display size before stashing in session state;
+                # the column layout never shows more than ~512px anyway, and
+                # thumbnails keep per-turn session memory small
+                thumbnail = match["image"].copy()
+                thumbnail.thumbnail((512, 512), Image.LANCZOS)
+
                 # Create result dictionary WITH lecture_number explicitly included
                 result = {
-                    "image_data": img_str,
+                    "image": thumbnail,
                     "similarity_score": match.get("similarity_score", 0),
                     "lecture_code": match.get("lecture_code", "Unknown"),
                     "lecture_number": match.get("lecture_number", "Unknown"),  # Explicitly include lecture_number
@@ -170,8 +477,26 @@ def search_images(query, top_k=3):
         logger.error(traceback.format_exc())
         return []
 
-def get_chat_history(messages):
-    """Format chat history for context in prompts"""
+def append_chat_history(role, text):
+    """Append one turn to the running chat-history string in session state
+
+    Keeping the formatted history incrementally makes each turn O(1)
+    instead of rebuilding the whole string from the message list.
+    """
+    prefix = "User" if role == "user" else "Assistant"
+    st.session_state.chat_history_str = (
+        st.session_state.get("chat_history_str", "") + f"{prefix}: {text}\n"
+    )
+
+def get_chat_history(messages=None):
+    """Format chat history for context in prompts
+
+    Without arguments this returns the incrementally maintained session
+    string; passing a message list rebuilds from scratch (e.g. for callers
+    outside the Streamlit session).
+    """
+    if messages is None:
+        return st.session_state.get("chat_history_str", "")
     chat_history = ""
     for msg in messages:
         if msg["role"] != "system":
@@ -185,13 +510,11 @@ def get_chat_history(messages):
                     chat_history += f"Assistant: {msg['content']}\n"
     return chat_history
 
-# LangChain Tools functions
-def text_search_tool(query: str) -> str:
-    """Tool to search for relevant text information."""
-    results = search_text_chunks(query)
+def format_text_results(results) -> str:
+    """Format already-retrieved text chunks for display or tool output."""
     if not results:
         return "No relevant text information found."
-    
+
     formatted_results = []
     for i, result in enumerate(results):
         formatted_results.append(
@@ -200,9 +523,14 @@ def text_search_tool(query: str) -> str:
             f"Source: {result['source']}, Lecture {result.get('lecture_number', 'Unknown')}, Page: {result['page']}\n"
             f"Content: {result['content']}\n"
         )
-    
+
     return "\n".join(formatted_results)
 
+# LangChain Tools functions
+def text_search_tool(query: str) -> str:
+    """Tool to search for relevant text information."""
+    return format_text_results(search_text_chunks(query))
+
 def image_search_tool(query: str) -> str:
     """Tool to search for relevant images."""
     results = search_images(query)
@@ -223,123 +551,170 @@ def image_search_tool(query: str) -> str:
     
     return "\n".join(formatted_results)
 
+@st.cache_resource
+def get_agent():
+    """Build the fallback conversational agent once and reuse it
+
+    The agent itself is stateless - memory is externalized by passing
+    chat_history into run() - so prompt templates and tool schemas are
+    only constructed on first use instead of per failure.
+    """
+    tools = [
+        Tool(
+            name="TextSearch",
+            func=text_search_tool,
+            description="Searches for relevant text from documents. Use this when you need to find specific information from text."
+        ),
+        Tool(
+            name="ImageSearch",
+            func=image_search_tool,
+            description="Searches for relevant images from documents. Use this when you need to find or show visual information."
+        )
+    ]
+    return initialize_agent(
+        tools,
+        get_llm(),
+        agent=AgentType.CHAT_CONVERSATIONAL_REACT_DESCRIPTION,
+        verbose=False,
+        handle_parsing_errors=True,
+        max_iterations=3,
+        callback_manager=CallbackManager([StreamingStdOutCallbackHandler()])
+    )
+
+def _build_prompt(query, text_results, image_results):
+    """Assemble the lecture-citation prompt from retrieved text and image results"""
+    # Format text context with explicit lecture numbers
+    text_context = ""
+    if text_results:
+        text_context = "\n\n".join([
+            f"Source: {result['module_code']}, Lecture {result.get('lecture_number', 'Unknown')}, Page {result['page']}\n"
+            f"Content: {result['content']}"
+            for result in text_results
+        ])
+
+    # Format image context with explicit lecture numbers
+    image_context = ""
+    if image_results:
+        image_context = "\n".join([
+            f"Image {i+1}: From {img.get('lecture_code', 'Unknown')}, Lecture {img.get('lecture_number', 'Unknown')}, "
+            f"Page {img.get('page_number', 'Unknown')} - "
+            f"Related to: {img.get('text', '')[:100]}...\n"
+            for i, img in enumerate(image_results)
+        ])
+
+    # Create enhanced prompt that explicitly instructs to cite lecture numbers
+    return f"""
+    User Query: {query}
+
+    Text Context:
+    {text_context if text_context else "No relevant text information found."}
+
+    Image References:
+    {image_context if image_context else "No relevant images found."}
+
+    INSTRUCTIONS:
+    1. Based on the provided context, answer the user's query thoroughly.
+    2. ALWAYS cite the specific lecture numbers when providing information (e.g., "As explained in Lecture 3..." or "According to Lecture 5...").
+    3. If there are relevant images that would help illustrate your answer, mention them by referring to their number and lecture (e.g., "As shown in Image 1 from Lecture 2...").
+    4. Make the lecture number references a natural part of your answer, not just citations at the end.
+    5. If the lecture number is unknown for some sources, you can mention this (e.g., "from an unspecified lecture").
+    """
+
 def generate_combined_response(query):
     """Generate a response that incorporates both text and image information using LangChain"""
     try:
-        # Make sure the LLM is working properly
-        llm = get_llm()
-        
-        # Test the LLM with a simple query first
-        try:
-            logger.info("Testing LLM with simple query...")
-            test_response = llm.invoke("Hello, are you working properly?")
-            logger.info("LLM test successful")
-        except Exception as llm_test_error:
-            logger.error(f"LLM test failed: {llm_test_error}")
-            raise
-        
-        # Setup tools
-        tools = [
-            Tool(
-                name="TextSearch",
-                func=text_search_tool,
-                description="Searches for relevant text from documents. Use this when you need to find specific information from text."
-            ),
-            Tool(
-                name="ImageSearch",
-                func=image_search_tool,
-                description="Searches for relevant images from documents. Use this when you need to find or show visual information."
-            )
-        ]
-        
+        # The cached LLM is health-checked once at first construction, so no
+        # per-turn warm-up round-trip is needed here
+        llm = get_llm(streaming=True)
+
+        # Check the semantic cache before paying for retrieval + generation;
+        # only fully materialized responses (stream already consumed) count
+        query_embedding = get_embeddings().embed_query(query)
+        cached_response = _semantic_cache_lookup(query_embedding)
+        if cached_response is not None and cached_response.get("answer_text"):
+            logger.info("Semantic cache hit - returning stored response")
+            hit = dict(cached_response)
+            hit.pop("answer_stream", None)
+            hit["original_query"] = query
+            return hit
+
         # Get raw text and image results for our enhanced context
-        text_results = search_text_chunks(query)
-        image_results = search_images(query)
-        
-        # Format text context with explicit lecture numbers
-        text_context = ""
-        if text_results:
-            text_context = "\n\n".join([
-                f"Source: {result['module_code']}, Lecture {result.get('lecture_number', 'Unknown')}, Page {result['page']}\n"
-                f"Content: {result['content']}"
-                for result in text_results
-            ])
-        
-        # Format image context with explicit lecture numbers
-        image_context = ""
-        if image_results:
-            image_context = "\n".join([
-                f"Image {i+1}: From {img.get('lecture_code', 'Unknown')}, Lecture {img.get('lecture_number', 'Unknown')}, "
-                f"Page {img.get('page_number', 'Unknown')} - "
-                f"Related to: {img.get('text', '')[:100]}...\n"
-                for i, img in enumerate(image_results)
-            ])
-        
-        # Create enhanced prompt that explicitly instructs to cite lecture numbers
-        prompt = f"""
-        User Query: {query}
-        
-        Text Context:
-        {text_context if text_context else "No relevant text information found."}
-        
-        Image References:
-        {image_context if image_context else "No relevant images found."}
-        
-        INSTRUCTIONS:
-        1. Based on the provided context, answer the user's query thoroughly.
-        2. ALWAYS cite the specific lecture numbers when providing information (e.g., "As explained in Lecture 3..." or "According to Lecture 5...").
-        3. If there are relevant images that would help illustrate your answer, mention them by referring to their number and lecture (e.g., "As shown in Image 1 from Lecture 2...").
-        4. Make the lecture number references a natural part of your answer, not just citations at the end.
-        5. If the lecture number is unknown for some sources, you can mention this (e.g., "from an unspecified lecture").
-        """
-        
+        # The two retrievals are independent, so run them concurrently -
+        # the GIL is released inside the Milvus/Mongo calls and model inference
+        # The query embedding computed for the cache lookup is reused for the
+        # text search; the image path embeds with its own multimodal pipeline
+        with ThreadPoolExecutor(max_workers=2) as executor:
+            text_future = executor.submit(
+                search_text_chunks, query, query_embedding=query_embedding
+            )
+            image_future = executor.submit(search_images, query)
+            text_results = text_future.result()
+            image_results = image_future.result()
+
+        prompt = _build_prompt(query, text_results, image_results)
+
         try:
             # First try the enhanced direct approach with lecture citation instructions
+            # Return the token stream so the UI can render incrementally via
+            # st.write_stream instead of blocking on the full completion
             logger.info("Generating response with explicit lecture citation instructions...")
-            response = llm.invoke(prompt)
-            logger.info("Direct LLM response generation successful")
-            
-            return {
-                "answer_text": response.content,
+            # llm.stream is lazy - the API call only fires on first
+            # iteration, which would otherwise happen inside st.write_stream
+            # and bypass the agent fallback below. Prime the stream here so
+            # failures still land in this except chain, then chain the first
+            # chunk back on for the UI.
+            stream = llm.stream(prompt)
+            first_chunk = next(stream, None)
+            if first_chunk is not None:
+                stream = itertools.chain([first_chunk], stream)
+            logger.info("Direct LLM streaming response started")
+
+            response = {
+                "answer_stream": stream,
+                "answer_text": "",
+                "text_results": text_results,
                 "image_results": image_results,
                 "has_images": len(image_results) > 0,
                 "original_query": query
             }
+            # The UI fills in answer_text once the stream is consumed, so
+            # caching the dict now makes it reusable on later lookups
+            _semantic_cache_store(query_embedding, response)
+            return response
         except Exception as direct_error:
             logger.error(f"Error with direct approach: {direct_error}")
             
-            # Fall back to the agent-based approach if direct approach fails
+            # Fall back to the cached agent if the direct approach fails
             try:
                 logger.info("Falling back to agent-based approach...")
-                # Create conversation memory
-                memory = ConversationBufferMemory(memory_key="chat_history", return_messages=True)
-                
-                # Initialize agent
-                agent = initialize_agent(
-                    tools,
-                    llm,
-                    agent=AgentType.CHAT_CONVERSATIONAL_REACT_DESCRIPTION,
-                    verbose=True,
-                    memory=memory,
-                    handle_parsing_errors=True,
-                    max_iterations=3
-                )
-                
+                agent = get_agent()
+
+                # Memory lives in session state and is passed in per call so
+                # the cached agent stays stateless
+                if "memory" in st.session_state:
+                    chat_history = st.session_state.memory.buffer
+                else:
+                    chat_history = []
+
                 # Get agent response
                 agent_prompt = f"""Please answer this query, and make sure to reference the specific lecture numbers when providing information: {query}"""
-                agent_response = agent.run(input=agent_prompt)
+                agent_response = agent.run(input=agent_prompt, chat_history=chat_history)
                 logger.info("Agent completed successfully")
-                
-                return {
+
+                response = {
                     "answer_text": agent_response,
+                    "text_results": text_results,
                     "image_results": image_results,
                     "has_images": len(image_results) > 0,
                     "original_query": query
                 }
+                _semantic_cache_store(query_embedding, response)
+                return response
             except Exception as agent_error:
                 logger.error(f"Agent error: {agent_error}")
                 return {
                     "answer_text": f"I encountered an error while generating an answer. Please try again or rephrase your question.",
+                    "text_results": text_results,
                     "image_results": image_results,
                     "has_images": len(image_results) > 0,
                     "original_query": query
@@ -352,6 +727,61 @@ def generate_combined_response(query):
         # Simplified fallback if everything else fails
         return {
             "answer_text": f"I encountered an error while processing your query. Please try again or rephrase your question.",
+            "text_results": [],
+            "image_results": [],
+            "has_images": False,
+            "original_query": query
+        }
+
+async def agenerate_combined_response(query):
+    """Async variant of generate_combined_response for programmatic callers.
+
+    Runs both retrievals in worker threads via asyncio.gather and awaits the
+    Gemini call with ainvoke, so the event loop can overlap retrieval, the
+    network round-trip and any other scheduled work. Returns a fully
+    materialized response dict (no answer_stream) - the Streamlit UI keeps
+    the sync path because st.write_stream consumes a sync generator.
+    """
+    try:
+        llm = get_llm()
+
+        query_embedding = await asyncio.to_thread(
+            get_embeddings().embed_query, query
+        )
+        cached_response = _semantic_cache_lookup(query_embedding)
+        if cached_response is not None and cached_response.get("answer_text"):
+            logger.info("Semantic cache hit - returning stored response")
+            hit = dict(cached_response)
+            hit.pop("answer_stream", None)
+            hit["original_query"] = query
+            return hit
+
+        # Both retrievals release the GIL inside Milvus/Mongo and model
+        # inference, so to_thread gives real overlap here
+        text_results, image_results = await asyncio.gather(
+            asyncio.to_thread(
+                search_text_chunks, query, query_embedding=query_embedding
+            ),
+            asyncio.to_thread(search_images, query),
+        )
+
+        prompt = _build_prompt(query, text_results, image_results)
+        result = await llm.ainvoke(prompt)
+
+        response = {
+            "answer_text": result.content,
+            "text_results": text_results,
+            "image_results": image_results,
+            "has_images": len(image_results) > 0,
+            "original_query": query
+        }
+        _semantic_cache_store(query_embedding, response)
+        return response
+    except Exception as e:
+        logger.error(f"Error in async response generation: {e}")
+        return {
+            "answer_text": f"I encountered an error while processing your query. Please try again or rephrase your question.",
+            "text_results": [],
             "image_results": [],
             "has_images": False,
             "original_query": query
@@ -374,24 +804,19 @@ def process_document_for_text(file, metadata):
         for doc in documents:
             doc.metadata.update(metadata)
         
-        # Split text into chunks
-        text_splitter = RecursiveCharacterTextSplitter(
-            chunk_size=1000,
-            chunk_overlap=200,
-            length_function=len
-        )
-        chunks = text_splitter.split_documents(documents)
-        
-        # Create embeddings and store in Milvus
-        embeddings = HuggingFaceEmbeddings(model_name="all-MiniLM-L6-v2")
+        # Split text into token-aware chunks with the cached splitter
+        chunks = get_text_splitter().split_documents(documents)
         
-        # Store in Milvus
-        vectorstore = Milvus.from_documents(
-            documents=chunks,
-            embedding=embeddings,
-            collection_name="combined_text_collection",
-            connection_args={"host": "localhost", "port": "19530"}
-        )
+        # Store in Milvus through the cached vectorstore, embedding in
+        # batches of 128 so each embed_documents call fills one padded
+        # forward pass instead of running chunk-by-chunk
+        vectorstore = get_text_vectorstore()
+        texts = [chunk.page_content for chunk in chunks]
+        metadatas = [chunk.metadata for chunk in chunks]
+        vectorstore.add_texts(texts, metadatas=metadatas, batch_size=128)
+
+        # Make sure the collection is served by the tuned HNSW index
+        _ensure_text_index(vectorstore)
         
         # Clean up temporary file
         try:
@@ -473,6 +898,9 @@ def run_app():
     if 'memory' not in st.session_state:
         st.session_state.memory = ConversationBufferMemory(memory_key="chat_history", return_messages=True)
 
+    if 'chat_history_str' not in st.session_state:
+        st.session_state.chat_history_str = ""
+
     # Initialize session state for options
     if 'show_sources' not in st.session_state:
         st.session_state.show_sources = False
@@ -508,16 +936,13 @@ def run_app():
                 st.write("Testing MongoDB connection:")
                 
                 try:
-                    import pymongo
-                    client = pymongo.MongoClient("mongodb://localhost:27017/")
-                    db = client["lecture_images"]
+                    db = get_mongo()["lecture_images"]
                     collection = db["pdf_images_5"]
                     count = collection.count_documents({})
                     st.write(f"MongoDB connection successful. Found {count} documents.")
-                    
-                    # Get schema info from Milvus
-                    from pymilvus import connections, Collection
-                    connections.connect("default", host="localhost", port="19530")
+
+                    # Get schema info from Milvus over the shared channel
+                    from pymilvus import Collection
                     collection = Collection("combined_embeddings_5")
                     schema = collection.schema
                     st.write("Milvus schema fields:", [field.name for field in schema.fields])
@@ -532,6 +957,7 @@ def run_app():
                     {"role": "system", "content": "I am a multimodal assistant that can help you find information from both text and images in your documents."}
                 ]
                 st.session_state.memory = ConversationBufferMemory(memory_key="chat_history", return_messages=True)
+                st.session_state.chat_history_str = ""
                 st.rerun()
         
         # Display chat history
@@ -551,34 +977,13 @@ def run_app():
                         # Show images if available and enabled
                         image_results = message["content"].get("image_results", [])
                         if image_results and st.session_state.include_images:
-                            st.subheader("Relevant Images:")
-                            
-                            # Log the number of images found for debugging
-                            st.write(f"Found {len(image_results)} relevant images")
-                            
-                            # Determine number of columns (max 3)
-                            num_cols = min(3, len(image_results))
-                            cols = st.columns(num_cols)
-                            
-                            for i, (col, img) in enumerate(zip(cols, image_results)):
-                                with col:
-                                    try:
-                                        # Display image from base64
-                                        st.image(
-                                            f"data:image/png;base64,{img['image_data']}", 
-                                            caption=f"Image {i+1}", 
-                                            use_column_width=True
-                                        )
-                                        st.markdown(f"**Score**: {img['similarity_score']:.2f}")
-                                        st.markdown(format_image_info(img))
-                                    except Exception as img_err:
-                                        st.error(f"Error displaying image {i+1}: {str(img_err)}")
+                            render_image_results(image_results)
                     
-                        # Display text sources if enabled
+                        # Display text sources if enabled, reusing the results
+                        # stored with the message instead of re-searching
                         if st.session_state.show_sources and isinstance(message["content"], dict):
-                            text_results = text_search_tool(message["content"].get("original_query", ""))
                             with st.expander("View Text Sources", expanded=False):
-                                st.markdown(text_results)
+                                st.markdown(format_text_results(message["content"].get("text_results", [])))
                     else:
                         # Just show text
                         st.markdown(message["content"])
@@ -587,7 +992,8 @@ def run_app():
         if prompt := st.chat_input("What would you like to know?"):
             # Add user message to chat history
             st.session_state.messages.append({"role": "user", "content": prompt})
-            
+            append_chat_history("user", prompt)
+
             # Display user message
             with st.chat_message("user"):
                 st.markdown(prompt)
@@ -596,50 +1002,35 @@ def run_app():
             with st.chat_message("assistant"):
                 with st.spinner("Thinking..."):
                     response = generate_combined_response(prompt)
-                    
+
+                    # Display text response - stream tokens as they arrive when
+                    # a stream is available, falling back to the full text
+                    if response.get("answer_stream") is not None:
+                        full_text = st.write_stream(
+                            chunk.content for chunk in response.pop("answer_stream")
+                        )
+                        response["answer_text"] = full_text
+                    else:
+                        response.pop("answer_stream", None)
+                        st.markdown(response["answer_text"])
+
                     # Add assistant response to chat history
                     st.session_state.messages.append({"role": "assistant", "content": response})
-                    
-                    # Display text response
-                    st.markdown(response["answer_text"])
-                    
+                    append_chat_history("assistant", response["answer_text"])
+
                     # Add original query to the response for source retrieval
                     response["original_query"] = prompt
                     
                     # Display images if available and enabled
                     image_results = response.get("image_results", [])
                     if image_results and st.session_state.include_images:
-                        st.subheader("Relevant Images:")
-                        
-                        # Debug information
-                        st.write(f"Found {len(image_results)} relevant images")
-                        
-                        if not image_results:
-                            st.warning("No images were found for this query.")
-                        else:
-                            # Determine number of columns (max 3)
-                            num_cols = min(3, len(image_results))
-                            cols = st.columns(num_cols)
-                            
-                            for i, (col, img) in enumerate(zip(cols, image_results)):
-                                with col:
-                                    try:
-                                        # Display image from base64
-                                        st.image(
-                                            f"data:image/png;base64,{img['image_data']}", 
-                                            caption=f"Image {i+1}", 
-                                            use_column_width=True
-                                        )
-                                        st.markdown(f"**Score**: {img['similarity_score']:.2f}")
-                                        st.markdown(format_image_info(img))
-                                    except Exception as img_err:
-                                        st.error(f"Error displaying image {i+1}: {str(img_err)}")
+                        render_image_results(image_results)
                     
-                    # Display text sources if enabled
+                    # Display text sources if enabled, from the retrieval
+                    # already performed inside generate_combined_response
                     if st.session_state.show_sources:
-                        text_results = text_search_tool(prompt)
                         with st.expander("View Text Sources", expanded=False):
-                            st.markdown(text_results)
+                            st.markdown(format_text_results(response.get("text_results", [])))
 
     # Upload Documents Tab
     with tab2:
@@ -29,6 +29,13 @@ from datetime import datetime
 import json
 import logging
 
+# SimSIMD provides SIMD-dispatched (AVX2/AVX-512/NEON) cosine kernels; fall
+# back to a NumPy matmul when it is not installed
+try:
+    import simsimd
+except ImportError:
+    simsimd = None
+
 # Configure logging
 logging.basicConfig(level=logging.INFO, 
                    format='%(asctime)s - %(levelname)s - %(message)s')
@@ -192,6 +199,59 @@ def setup_mongodb(config):
         
 #         # Create collection and schema...
 
+# IVF_PQ needs real training data: kmeans wants at least nlist rows and
+# every nbits=8 codebook needs 256+ vectors, so the few dozen images a
+# single lecture yields cannot train it. Below this row count the plain
+# IVF_FLAT index is used instead.
+_IVF_PQ_MIN_ROWS = 10_000
+
+
+def _vector_index_params(num_entities: int) -> dict:
+    """Pick vector index parameters suited to the collection's row count"""
+    if num_entities >= _IVF_PQ_MIN_ROWS:
+        # PQ codes compress each vector to a few dozen bytes, cutting
+        # memory traffic during distance scans; nlist scales ~sqrt(n)
+        nlist = min(1024, max(128, int(num_entities ** 0.5)))
+        return {
+            "index_type": "IVF_PQ",
+            "metric_type": "IP",
+            "params": {"nlist": nlist, "m": 16, "nbits": 8}
+        }
+    return {
+        "index_type": "IVF_FLAT",
+        "metric_type": "IP",
+        "params": {"nlist": 128}
+    }
+
+
+def _ensure_vector_index(collection):
+    """Align the vector index with the collection's current size.
+
+    New collections start on IVF_FLAT (there is nothing to train PQ on);
+    once ingestion pushes the row count past _IVF_PQ_MIN_ROWS the index is
+    rebuilt as IVF_PQ.
+    """
+    try:
+        desired = _vector_index_params(collection.num_entities)
+        current = next(
+            (idx for idx in collection.indexes if idx.field_name == "combined_embedding"),
+            None,
+        )
+        if current is not None and current.params.get("index_type") == desired["index_type"]:
+            return
+        collection.release()
+        if current is not None:
+            collection.drop_index(index_name=current.index_name)
+        logger.info(
+            f"Rebuilding vector index as {desired['index_type']} "
+            f"for {collection.num_entities} entities"
+        )
+        collection.create_index("combined_embedding", desired)
+        collection.load()
+    except Exception as index_error:
+        logger.warning(f"Could not align vector index with collection size: {index_error}")
+
+
 # Improved function that reuses existing collections
 def setup_milvus(config, embedding_dim):
     """Setup Milvus connection and collection with enhanced error handling"""
@@ -234,14 +294,21 @@ def setup_milvus(config, embedding_dim):
         # Create collection
         collection = Collection(config.milvus_collection, schema)
         
-        # Create index with COSINE similarity
-        index_params = {
-            "index_type": "IVF_FLAT",
-            "metric_type": "COSINE",
-            "params": {"nlist": 128}
-        }
-        logger.info("Creating index on combined_embedding field with COSINE similarity")
+        # A fresh collection has no rows to train PQ codebooks on, so this
+        # starts as IVF_FLAT; _ensure_vector_index upgrades to IVF_PQ after
+        # ingestion once the row count can support training. The embeddings
+        # are L2-normalized, so inner product equals cosine.
+        index_params = _vector_index_params(0)
+        logger.info(f"Creating {index_params['index_type']} index on combined_embedding field (IP metric)")
         collection.create_index("combined_embedding", index_params)
+
+        # Scalar indexes make metadata pre-filters (module_id/lecture_number
+        # expressions) logarithmic instead of full column scans
+        try:
+            collection.create_index("module_id", {"index_type": "INVERTED"})
+            collection.create_index("lecture_number", {"index_type": "STL_SORT"})
+        except Exception as scalar_index_error:
+            logger.warning(f"Could not create scalar indexes: {scalar_index_error}")
         logger.info("Milvus collection setup complete")
         
         return collection
@@ -250,6 +317,79 @@ def setup_milvus(config, embedding_dim):
         logger.error(f"Error setting up Milvus: {e}")
         raise
 
+# Process-level model cache keyed by model name and device. Loading CLIP or
+# a SentenceTransformer costs seconds of disk and init time, so repeated
+# processing or search calls within one session must not reload them.
+_MODEL_CACHE: Dict[str, Any] = {}
+
+
+def _get_clip(model_name: str, device: str):
+    """Return a cached (CLIPModel, CLIPProcessor) pair for model_name on device"""
+    key = f"clip:{model_name}:{device}"
+    if key not in _MODEL_CACHE:
+        model = CLIPModel.from_pretrained(model_name).to(device)
+        model.eval()
+        processor = CLIPProcessor.from_pretrained(model_name)
+        _MODEL_CACHE[key] = (model, processor)
+    return _MODEL_CACHE[key]
+
+
+def _get_sentence_transformer(model_name: str, device: str) -> SentenceTransformer:
+    """Return a cached SentenceTransformer for model_name on device"""
+    key = f"st:{model_name}:{device}"
+    if key not in _MODEL_CACHE:
+        model = SentenceTransformer(model_name).to(device)
+        model.eval()
+        _MODEL_CACHE[key] = model
+    return _MODEL_CACHE[key]
+
+
+def _get_text_dim_reducer(input_dim: int, output_dim: int, device: str) -> "DimensionalityReducer":
+    """Return a cached text dimension reducer with saved weights applied.
+
+    The weights file mtime is part of the cache key, so reprocessing a
+    document (which rewrites the weights) transparently invalidates the
+    cached reducer.
+    """
+    weights_path = "saved_models/text_dim_reducer.pt"
+    try:
+        mtime = os.path.getmtime(weights_path)
+    except OSError:
+        mtime = None
+    key = f"reducer:{input_dim}:{output_dim}:{device}:{mtime}"
+    if key not in _MODEL_CACHE:
+        reducer = DimensionalityReducer(
+            input_dim=input_dim,
+            output_dim=output_dim
+        ).to(device)
+        reducer.train(False)
+        if mtime is not None:
+            reducer.load_state_dict(torch.load(weights_path))
+            logger.info("Loaded saved text dimension reducer weights")
+        else:
+            logger.warning("Could not load saved dimension reducer weights")
+        _MODEL_CACHE[key] = reducer
+    return _MODEL_CACHE[key]
+
+
+def cosine_similarity_matrix(embeddings: np.ndarray) -> np.ndarray:
+    """Pairwise cosine similarity for a batch of row vectors.
+
+    Dispatches to SimSIMD's SIMD cosine kernels when the package is
+    installed and falls back to a single normalized matmul otherwise -
+    either way the computation never drops into a Python-level loop.
+    """
+    norms = np.linalg.norm(embeddings, axis=1, keepdims=True)
+    normalized = (embeddings / np.maximum(norms, 1e-12)).astype(np.float32)
+    if simsimd is not None:
+        # cdist returns cosine *distance*; similarity is its complement
+        return 1.0 - np.asarray(
+            simsimd.cdist(normalized, normalized, metric="cosine"),
+            dtype=np.float32,
+        )
+    return normalized @ normalized.T
+
+
 def save_models(image_dim_reducer, text_dim_reducer, config):
     """Save the trained dimensionality reducers to disk"""
     if config.use_dim_reduction and image_dim_reducer is not None and text_dim_reducer is not None:
@@ -376,15 +516,14 @@ def create_embeddings_and_store(
     if "lecture_title" not in pdf_metadata or pdf_metadata["lecture_title"] is None:
         pdf_metadata["lecture_title"] = ""
 
-    # Initialize models
-    clip_model = CLIPModel.from_pretrained(config.clip_model_name).to(device)
-    clip_processor = CLIPProcessor.from_pretrained(config.clip_model_name)
-    
+    # Initialize models through the process-level cache
+    clip_model, clip_processor = _get_clip(config.clip_model_name, device)
+
     # Load SentenceTransformer if configured
     sentence_transformer = None
     if config.use_separate_text_model:
         logger.info(f"Using SentenceTransformer ({config.text_model_name}) for text embeddings")
-        sentence_transformer = SentenceTransformer(config.text_model_name).to(device)
+        sentence_transformer = _get_sentence_transformer(config.text_model_name, device)
     
     # Get embedding dimensions
     clip_dim = 512  # Default CLIP embedding size
@@ -427,7 +566,10 @@ def create_embeddings_and_store(
     all_texts = []
     image_info = []  # Store page and position info
 
-    # Open PDF and get total pages
+    # Open PDF and get total pages. Opening by path lets MuPDF read the
+    # compressed streams incrementally from disk (no Python-level read of
+    # the whole file); extract_image below already hands back the raw
+    # encoded bytes, avoiding a decode/recompress round-trip.
     try:
         pdf_document = fitz.open(pdf_path)
         total_pages = len(pdf_document)
@@ -441,9 +583,29 @@ def create_embeddings_and_store(
     for page_num in pbar:
         page = pdf_document.load_page(page_num)
         images_on_page = page.get_images(full=True)
-        
+
         pbar.set_postfix({"Images on page": len(images_on_page)})
 
+        # Triage scanned/image-only pages: almost no extractable text plus a
+        # raster covering essentially the whole page means a full-page scan
+        # (typically a single image), where stream decompression dominates
+        # and the extracted image carries no standalone meaning worth
+        # embedding
+        if images_on_page:
+            page_text_len = len(page.get_text("text").strip())
+            # get_images tuples are (xref, smask, width, height, ...)
+            largest_pixels = max(img[2] * img[3] for img in images_on_page)
+            page_area = page.rect.width * page.rect.height
+            # A scan rendered at >=72 dpi has a pixel area at least the
+            # page's point area; 0.8 tolerates margins and cropping
+            if page_text_len < 20 and largest_pixels >= 0.8 * page_area:
+                logger.info(
+                    f"Skipping page {page_num + 1}: looks scanned "
+                    f"(largest image {largest_pixels}px vs page area "
+                    f"{page_area:.0f}, {page_text_len} chars of text)"
+                )
+                continue
+
         for img_index, img in enumerate(images_on_page):
             # Extract image and text
             xref = img[0]
@@ -506,13 +668,11 @@ def create_embeddings_and_store(
     
     # Filter duplicates using the improved clustering approach
     logger.info("\nPhase 3: Filtering duplicates using cluster-based approach...")
-    image_embeddings = F.normalize(initial_embeddings, p=2, dim=1)
-    
-    # Calculate similarity matrix
-    similarity_matrix = torch.matmul(image_embeddings, image_embeddings.t())
-    
+    # Calculate the pairwise similarity matrix with the vectorized helper
+    # (SimSIMD kernels when installed, one NumPy matmul otherwise)
+    similarity_np = cosine_similarity_matrix(initial_embeddings.cpu().numpy())
+
     # Initialize for cluster-based approach
-    similarity_np = similarity_matrix.cpu().numpy()
     clusters = []
     processed = set()
     
@@ -733,12 +893,15 @@ def create_embeddings_and_store(
             if successful_inserts > 0:
                 milvus_collection.flush()
                 logger.info(f"Successfully inserted {successful_inserts} entities in batches")
+                # Upgrade to IVF_PQ once there is enough data to train it
+                _ensure_vector_index(milvus_collection)
     
     # Save models for later use in search
     save_models(image_dim_reducer, text_dim_reducer, config)
     
-    # Release model resources
-    del clip_model, clip_processor, sentence_transformer, image_dim_reducer, text_dim_reducer
+    # The cached models stay resident for the next call; only drop the
+    # per-run dimension reducers and scratch GPU memory
+    del image_dim_reducer, text_dim_reducer
     clear_gpu_cache()
     
     return {
@@ -761,10 +924,16 @@ def search_images_by_text(
     mongodb_uri: str = "mongodb://localhost:27017/",
     milvus_host: str = "localhost",
     milvus_port: str = "19530",
-    device: str = "cuda" if torch.cuda.is_available() else "cpu"
+    device: str = "cuda" if torch.cuda.is_available() else "cpu",
+    mongo_client: Optional[pymongo.MongoClient] = None,
+    expr: Optional[str] = None
 ):
     """
     Search for images using text query - retrieving from Milvus and MongoDB
+
+    Pass mongo_client to reuse a pooled connection; otherwise a client is
+    created and closed within the call. An optional Milvus boolean
+    expression (expr) pre-filters candidates before the vector scan.
     """
     logger.info(f"Searching for images matching: '{query}'")
     
@@ -791,27 +960,17 @@ def search_images_by_text(
         normalize_combined = True
         text_model_name = "all-MiniLM-L6-v2"
     
-    # Load models
+    # Load models through the process-level cache - repeated searches in one
+    # session reuse the resident encoder and reducer
     logger.info("Loading models...")
-    sentence_transformer = SentenceTransformer(text_model_name).to(device)
-    
+    sentence_transformer = _get_sentence_transformer(text_model_name, device)
+
     # Get text embedding dimension
     text_dim = sentence_transformer.get_sentence_embedding_dimension()
     logger.info(f"SentenceTransformer embedding dimension: {text_dim}")
-    
-    # Create new dimension reducers with same architecture
-    text_dim_reducer = DimensionalityReducer(
-        input_dim=text_dim,
-        output_dim=output_dim
-    ).to(device)
-    text_dim_reducer.train(False)
-    
-    # Load the saved weights for dimension reducers
-    try:
-        text_dim_reducer.load_state_dict(torch.load("saved_models/text_dim_reducer.pt"))
-        logger.info("Loaded saved text dimension reducer weights")
-    except FileNotFoundError:
-        logger.warning("Could not load saved dimension reducer weights")
+
+    # Cached reducer with saved weights applied (keyed on the weights mtime)
+    text_dim_reducer = _get_text_dim_reducer(text_dim, output_dim, device)
     
     # Generate query embedding with SentenceTransformer
     logger.info("Generating query embedding...")
@@ -852,39 +1011,57 @@ def search_images_by_text(
     # Search Milvus for similar vectors
     logger.info("Searching vector database...")
     try:
-        # Connect to Milvus
-        connections.connect(host=milvus_host, port=milvus_port)
+        # Reuse the shared gRPC channel when one is already open
+        if not connections.has_connection("default"):
+            connections.connect(host=milvus_host, port=milvus_port)
         collection = Collection(milvus_collection)
         collection.load()
         
-        # Use COSINE similarity for search
+        # IP on normalized vectors equals cosine; nprobe=16 balances recall
+        # against the number of IVF cells scanned
         search_params = {
-            "metric_type": "COSINE",
-            "params": {"ef": 100}
+            "metric_type": "IP",
+            "params": {"nprobe": 16}
         }
-        
-        # Perform search
-        milvus_results = collection.search(
-            data=[query_vector],
-            anns_field="combined_embedding",
-            param=search_params,
-            limit=top_k,
-            output_fields=["page_number", "text", "module_id", "lecture_code", "lecture_number", "lecture_title"]
-        )
+
+        output_fields = ["page_number", "text", "module_id", "lecture_code", "lecture_number", "lecture_title"]
+
+        # Perform search, falling back to the legacy COSINE params for
+        # collections indexed before the switch to IVF_PQ
+        try:
+            milvus_results = collection.search(
+                data=[query_vector],
+                anns_field="combined_embedding",
+                param=search_params,
+                limit=top_k,
+                expr=expr,
+                output_fields=output_fields
+            )
+        except Exception as search_error:
+            logger.warning(f"IP search failed ({search_error}), retrying with COSINE params")
+            milvus_results = collection.search(
+                data=[query_vector],
+                anns_field="combined_embedding",
+                param={"metric_type": "COSINE", "params": {"ef": 100}},
+                limit=top_k,
+                expr=expr,
+                output_fields=output_fields
+            )
         
         milvus_hits = milvus_results[0]
         logger.info(f"Search returned {len(milvus_hits)} results")
-        
-    finally:
-        # Clean up Milvus connection
-        connections.disconnect("default")
-    
+
+    except Exception as e:
+        logger.error(f"Milvus search failed: {e}")
+        raise
+
     # Retrieve images from MongoDB using the IDs from Milvus
     logger.info("Retrieving images from database...")
     matches = []
+    owns_mongo_client = mongo_client is None
     try:
-        # Connect to MongoDB
-        client = pymongo.MongoClient(mongodb_uri)
+        # Use the pooled client when provided, otherwise connect ad hoc
+        client = pymongo.MongoClient(mongodb_uri) if owns_mongo_client else mongo_client
         db = client[mongodb_db]
         mongo_collection = db[mongodb_collection]
         
@@ -919,16 +1096,16 @@ def search_images_by_text(
                 logger.warning(f"Document with ID {doc_id} not found in MongoDB")
     
     finally:
-        # Clean up MongoDB connection
-        client.close()
+        # Only close connections this call created; pooled clients stay open
+        if owns_mongo_client:
+            client.close()
     
     logger.info(f"Found {len(matches)} matching images")
     
-    # Clean up model resources
-    del sentence_transformer, text_dim_reducer
+    # Models stay cached for the next search; only release scratch GPU memory
     if torch.cuda.is_available():
         torch.cuda.empty_cache()
-    
+
     return matches
 
 
@@ -42,6 +42,22 @@ def get_embeddings(text, max_length=512):
     
     return embedding_list
 
+# Function to quantize embeddings to int8
+def quantize_embedding_int8(embedding):
+    """Symmetrically quantize a float embedding to int8 (4x smaller).
+
+    Scales by 127/max|x| so the full int8 range is used. Intended for an
+    int8 vector field searched with IP, keeping the float vector around
+    for exact reranking of the top-k.
+    """
+    vec = np.asarray(embedding, dtype=np.float32)
+    scale = np.max(np.abs(vec))
+    if scale == 0:
+        return [0] * len(embedding)
+
+    q8 = np.clip(np.round(vec * 127.0 / scale), -127, 127).astype(np.int8)
+    return q8.tolist()
+
 # === FUNCTION TO EXTRACT TEXT FROM PDF ===
 def extract_text_from_pdf(pdf_path):
     """Extract text from a PDF file with page information."""
@@ -143,6 +159,7 @@ for pdf_idx, pdf in enumerate(pdf_files[:1]):
                 # Create record, no ID field as it's auto-generated
                 record = {
                     "embedding": embedding,
+                    "embedding_int8": quantize_embedding_int8(embedding),
                     "module_code": module_code,
                     "module_name": module_name,
                     "lecture_number": lecture_number,
@@ -237,6 +254,7 @@ if data:  # If the sample worked, proceed with full processing
                         
                         record = {
                             "embedding": embedding,
+                            "embedding_int8": quantize_embedding_int8(embedding),
                             "module_code": module_code,
                             "module_name": module_name,
                             "lecture_number": lecture_number,